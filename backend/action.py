@@ -1,34 +1,51 @@
+import dataclasses
 import enum
+import operator
+import os
 import random
+from collections.abc import Callable, Iterable, Mapping
+from types import MappingProxyType
 
-from pydantic import BaseModel
+# Set RNG_SEED to make a run's rolls reproducible (balancing, debugging).
+RNG_SEED = os.environ.get("RNG_SEED")
 
+# One generator for all rolls, with its methods bound once at import so the
+# helpers below skip the module attribute lookups on every call.
+_rng = random.Random(RNG_SEED)
+_roll = _rng.random
+_randrange = _rng.randrange
 
-def rocket_damage():
-    return random.randint(0, 50)
+if RNG_SEED is None:
+    # Forked workers would otherwise all replay the parent's sequence.
+    os.register_at_fork(after_in_child=_rng.seed)
 
 
-def rocket_hit():
-    return random.random() > 0.4
+def rocket_damage() -> int:
+    return _randrange(51)
 
 
-def charge_hit():
-    return random.random() > 0.25
+def rocket_hit() -> bool:
+    return _roll() > 0.4
 
 
-def granade_hit():
-    return random.random() > 0.3
+def charge_hit() -> bool:
+    return _roll() > 0.25
 
 
-def flamethrower_fail():
-    return random.random() > 0.1
+def granade_hit() -> bool:
+    return _roll() > 0.3
+
+
+def flamethrower_fail() -> bool:
+    return _roll() > 0.1
 
 #Menetetään tai ei menetetä 1 rage
-def fail_dmg_boost_loss():
-    return int(random.random() > 0.5)
+def fail_dmg_boost_loss() -> int:
+    return int(_roll() > 0.5)
 
 
-class Effect(BaseModel):
+@dataclasses.dataclass(slots=True, frozen=True)
+class Effect:
     self_heal: int = 0
     self_damage: int = 0
     enemy_damage: int = 0
@@ -40,6 +57,34 @@ class Effect(BaseModel):
     loose_damage_boost: int = 0
 
 
+# Actions without rolls always produce the same effect, so they share one
+# instance. Effect is frozen, which makes handing out the same object safe.
+_RAGE_UP_EFFECT = Effect(gain_damage_boost=1)
+_PATCH_UP_EFFECT = Effect(self_heal=50)
+_ARMOR_UP_EFFECT = Effect(gain_armor=1)
+_OMNIBOOST_EFFECT = Effect(gain_armor=1, gain_damage_boost=1, self_heal=50)
+
+# Rolled actions only have a handful of outcomes each, so every outcome is
+# built up front too. Miss tuples are indexed by fail_dmg_boost_loss().
+_ROCKET_HIT_EFFECTS = tuple(Effect(enemy_damage=damage) for damage in range(51))
+_ROCKET_MISS_EFFECTS = (
+    Effect(loose_armor=1),
+    Effect(loose_armor=1, loose_damage_boost=1),
+)
+_CHARGE_HIT_EFFECT = Effect(enemy_damage=50, self_damage=10)
+_CHARGE_MISS_EFFECTS = (
+    Effect(self_damage=20),
+    Effect(self_damage=20, loose_damage_boost=1),
+)
+_GRANADE_HIT_EFFECT = Effect(enemy_damage=25)
+_GRANADE_MISS_EFFECTS = _ROCKET_MISS_EFFECTS
+_FLAMETHROWER_HIT_EFFECT = Effect(enemy_damage=100)
+_FLAMETHROWER_MISS_EFFECTS = (
+    Effect(self_damage=100),
+    Effect(self_damage=100, loose_damage_boost=1),
+)
+
+
 class ActionEnum(enum.StrEnum):
     shoot_rocket = "shoot_rocket"
     rage_up = "rage_up"
@@ -51,45 +96,61 @@ class ActionEnum(enum.StrEnum):
     omniboost = "omniboost"
 
     def effect(self) -> Effect:
-        effect = Effect()
-        match self:
-            case ActionEnum.shoot_rocket:
-                if rocket_hit():
-                    effect.enemy_damage = rocket_damage()
-                else:
-                    effect.loose_armor = 1
-                    effect.loose_damage_boost = fail_dmg_boost_loss()
-
-            case ActionEnum.rage_up:
-                effect.gain_damage_boost = 1
-
-            case ActionEnum.patch_up:
-                effect.self_heal = 50
-
-            case ActionEnum.charge:
-                if charge_hit():
-                    effect.enemy_damage = 50
-                    effect.self_damage = 10
-                else:
-                    effect.self_damage = 20
-                    effect.loose_damage_boost = fail_dmg_boost_loss()
-            case ActionEnum.throw_granade:
-                if granade_hit():
-                    effect.enemy_damage = 25
-                else:
-                    effect.loose_armor = 1
-                    effect.loose_damage_boost = fail_dmg_boost_loss()
-            case ActionEnum.fire_flamethrower:
-                if flamethrower_fail():
-                    effect.enemy_damage = 100
-                else:
-                    effect.self_damage = 100
-                    effect.loose_damage_boost = fail_dmg_boost_loss()
-            case ActionEnum.armor_up:
-                effect.gain_armor = 1
-            case ActionEnum.omniboost:
-                effect.gain_armor = 1
-                effect.gain_damage_boost = 1
-                effect.self_heal = 50
-            
-        return effect
+        return _DISPATCH[self]()
+
+
+def _shoot_rocket() -> Effect:
+    if rocket_hit():
+        return _ROCKET_HIT_EFFECTS[rocket_damage()]
+    return _ROCKET_MISS_EFFECTS[fail_dmg_boost_loss()]
+
+
+def _charge() -> Effect:
+    if charge_hit():
+        return _CHARGE_HIT_EFFECT
+    return _CHARGE_MISS_EFFECTS[fail_dmg_boost_loss()]
+
+
+def _throw_granade() -> Effect:
+    if granade_hit():
+        return _GRANADE_HIT_EFFECT
+    return _GRANADE_MISS_EFFECTS[fail_dmg_boost_loss()]
+
+
+def _fire_flamethrower() -> Effect:
+    if flamethrower_fail():
+        return _FLAMETHROWER_HIT_EFFECT
+    return _FLAMETHROWER_MISS_EFFECTS[fail_dmg_boost_loss()]
+
+
+# Frozen at import. Keys are the enum members, and since ActionEnum is a
+# StrEnum they also match the plain string values sent over IPC.
+_DISPATCH: Mapping[ActionEnum, Callable[[], Effect]] = MappingProxyType({
+    ActionEnum.shoot_rocket: _shoot_rocket,
+    ActionEnum.rage_up: lambda: _RAGE_UP_EFFECT,
+    ActionEnum.patch_up: lambda: _PATCH_UP_EFFECT,
+    ActionEnum.charge: _charge,
+    ActionEnum.throw_granade: _throw_granade,
+    ActionEnum.fire_flamethrower: _fire_flamethrower,
+    ActionEnum.armor_up: lambda: _ARMOR_UP_EFFECT,
+    ActionEnum.omniboost: lambda: _OMNIBOOST_EFFECT,
+})
+
+# Value -> member lookup without going through EnumType.__call__
+ACTIONS_BY_VALUE: Mapping[str, ActionEnum] = MappingProxyType(
+    {action.value: action for action in ActionEnum}
+)
+
+
+EFFECT_FIELDS = tuple(field.name for field in dataclasses.fields(Effect))
+_effect_row = operator.attrgetter(*EFFECT_FIELDS)
+
+
+def simulate_actions(actions: Iterable[ActionEnum]) -> list[tuple[int, ...]]:
+    """Roll each action once and return the effects as rows of ints.
+
+    Columns follow EFFECT_FIELDS. Meant for balancing runs that only need
+    the numbers, so callers can aggregate rows without touching Effect.
+    """
+    effect = ActionEnum.effect
+    return [_effect_row(effect(action)) for action in actions]
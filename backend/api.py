@@ -8,15 +8,20 @@ utilizing MCP (Model Context Protocol) for AI-driven battle interactions.
 """
 
 import asyncio
+import functools
 from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, Request, Response, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 from .storage import (
     GameSession,
+    SessionFile,
+    mark_session_dirty,
     save_session_state,
-    storage_middleware,
+    state_writer,
+    stop_state_writer,
     read_state,
 )
 from .ipc import delete_socket, ipc_server
@@ -62,7 +67,9 @@ async def lifespan(app: FastAPI):
 
     Manages the startup and shutdown of the FastAPI application, including:
     - Loading game state from persistent storage on startup
+    - Starting the background writer that persists changed game state
     - Starting the IPC server for inter-process communication
+    - Spawning the pool of MCP servers used by battle commands
     - Cleaning up resources on shutdown
 
     Args:
@@ -71,20 +78,31 @@ async def lifespan(app: FastAPI):
     Yields:
         None: Control is yielded to the application runtime
     """
-    app.state.state = read_state()
-    ipc = asyncio.create_task(ipc_server(app.state.state))
+    # Reading every session file blocks, so keep it off the event loop
+    app.state.state = await asyncio.to_thread(read_state)
+    app.state.dirty_sessions = set()
+    app.state.state_dirty = asyncio.Event()
+    app.state.state_writer_stopping = False
+    writer = asyncio.create_task(state_writer(app))
+    ipc = asyncio.create_task(
+        ipc_server(app.state.state, functools.partial(mark_session_dirty, app))
+    )
     app.state.chat = Chat()
+    await app.state.chat.start()
     yield
 
+    await app.state.chat.close()
     ipc.cancel()
     delete_socket()
+    # Flush whatever the writer had not picked up yet
+    await stop_state_writer(app, writer)
 
 
 def get_chat(request: Request):
     return request.app.state.chat
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Add CORS middleware to allow frontend requests
 app.add_middleware(
@@ -95,8 +113,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.middleware("http")(storage_middleware)
-
 
 @app.get("/current-session")
 def current_session(request: Request):
@@ -117,8 +133,8 @@ def current_session(request: Request):
     return game_session
 
 
-@app.get("/session-state")
-def current_session_state(request: Request) -> GameSession:
+@app.get("/session-state", response_model=GameSession)
+async def current_session_state(request: Request):
     """
     Get the current game session state.
 
@@ -126,6 +142,11 @@ def current_session_state(request: Request) -> GameSession:
     player health, armor, rage, enemy status, and action history. If no
     session exists, creates a new temporary session with default values.
 
+    Runs on the event loop, like the IPC handler that applies actions, so
+    the session is never read while an action is half applied. The session
+    is dumped to JSON bytes in one pass rather than through a dict that is
+    then encoded again.
+
     Args:
         request (Request): The HTTP request object
 
@@ -136,14 +157,17 @@ def current_session_state(request: Request) -> GameSession:
 
     if game_session is None:
         # Return a temporary session with default values
-        return GameSession.new_session("temp_session")
+        state = GameSession.new_session("temp_session")
+        return Response(SessionFile.dump_json(state), media_type="application/json")
 
     state = request.app.state.state.get(game_session)
     if state is None:
+        # Polling an existing session changes nothing, so only a new one
+        # needs storing
         state = GameSession.new_session(game_session)
+        save_session_state(request, state)
 
-    save_session_state(request, state)
-    return state
+    return Response(SessionFile.dump_json(state), media_type="application/json")
 
 
 @app.get("/new-words-player")
@@ -209,36 +233,21 @@ async def command(command: Command, request: Request, chat: Chat = Depends(get_c
     state = request.app.state.state.get(game_session)
     if state is None:
         state = GameSession.new_session(game_session)
+        save_session_state(request, state)
 
-    save_session_state(request, state)
+    # The actions themselves are stored as the IPC server applies them
     response = await chat.process_query(
         game_session,
         True,
-        query="1. "
-        + command.action1
-        + ", "
-        + command.action2
-        + ", "
-        + command.action3
-        + " 2. "
-        + command.player
-        + " 3. "
-        + state.current_enemy.role,
+        query=f"1. {command.action1}, {command.action2}, {command.action3}"
+        f" 2. {command.player} 3. {state.current_enemy.role}",
     )
     enemy_voice_line = await state.current_enemy.next_action(chat)
     enemy_response = await chat.process_query(
         game_session,
         False,
-        query="1. "
-        + enemy_voice_line[0]
-        + ", "
-        + enemy_voice_line[1]
-        + ", "
-        + enemy_voice_line[2]
-        + " 2. "
-        + state.current_enemy.role
-        + " 3. "
-        + command.player,
+        query=f"1. {enemy_voice_line[0]}, {enemy_voice_line[1]}, {enemy_voice_line[2]}"
+        f" 2. {state.current_enemy.role} 3. {command.player}",
     )
     return response, enemy_response
 
@@ -297,7 +306,7 @@ def get_archetypes():
 
 
 @app.post("/archetype")
-def select_archetype(
+async def select_archetype(
     request_data: ArchetypeRequest,
     request: Request,
     response: Response,
@@ -12,4 +12,5 @@ class Enemy(BaseModel):
     async def next_action(self, chat: Chat) -> tuple[str, str, str]:
         words = await chat.get_new_words()
         assert words is not None
-        return words
+        first, second, third, *_ = words.split()
+        return first, second, third
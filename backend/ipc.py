@@ -1,34 +1,44 @@
 import logging
 import os
-import sys
 import tempfile
-import json
 import socket
 
 import asyncio
+from collections.abc import Callable
+from typing import TYPE_CHECKING
 
+import ormsgpack
 
-if __package__ == "backend":
+
+# mcp_server.py imports this module in every MCP server process; importing
+# storage at runtime would drag in enemy -> mcp_client -> langchain there.
+if TYPE_CHECKING:
     from .storage import GameSession
-else:
-    from storage import GameSession
 
 SOCKET_PATH = tempfile.gettempdir() + "/ork-game.socket"
 
+# Messages are msgpack payloads behind a 4-byte big-endian length prefix
+HEADER_SIZE = 4
+
 logger = logging.getLogger("uvicorn.error")
 
 
-async def ipc_server(state: dict[str, GameSession]):
+async def ipc_server(
+    state: "dict[str, GameSession]", on_change: Callable[[str], None]
+):
     async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         try:
-            data = await reader.readline()
-            if not data:
-                return
-            message = json.loads(data)
+            header = await reader.readexactly(HEADER_SIZE)
+            data = await reader.readexactly(int.from_bytes(header, "big"))
+            message = ormsgpack.unpackb(data)
             state[message["session_name"]].act(
                 message["action"], message["player_turn"]
             )
+            on_change(message["session_name"])
 
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                logger.warning("Dropped truncated IPC message")
         except Exception:
             logger.exception("Failed to read from socket")
         finally:
@@ -36,25 +46,26 @@ async def ipc_server(state: dict[str, GameSession]):
             await writer.wait_closed()
 
     server = await asyncio.start_unix_server(handle_client, path=SOCKET_PATH)
-    logger.info(f"✅ Async server listening on {SOCKET_PATH}")
+    logger.info("✅ Async server listening on %s", SOCKET_PATH)
 
     async with server:
         await server.serve_forever()
 
 
 def send_ipc_message(session_name, action: str, player_turn: bool):
-    print(
-        f"Send ipc: session={session_name} action={action} player_turn={player_turn}",
-        file=sys.stderr,
-        flush=True,
+    logger.debug(
+        "Send ipc: session=%s action=%s player_turn=%s",
+        session_name,
+        action,
+        player_turn,
     )
     client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     client.connect(SOCKET_PATH)
 
-    message = json.dumps(
+    message = ormsgpack.packb(
         {"session_name": session_name, "action": action, "player_turn": player_turn}
     )
-    client.sendall(message.encode())
+    client.sendall(len(message).to_bytes(HEADER_SIZE, "big") + message)
 
     client.close()
 
@@ -1,13 +1,49 @@
 import asyncio
+import functools
+import inspect
+import os
 import time
 import logging
-from mcp import ClientSession, stdio_client, StdioServerParameters
+import anyio
+from mcp import ClientSession, McpError, stdio_client, StdioServerParameters
 from pydantic import BaseModel
 from langchain.agents import create_agent
+from langchain.chat_models import init_chat_model
 from langchain_mcp_adapters.tools import load_mcp_tools
 
+try:
+    import uvloop
+except ImportError:  # Not built for Windows
+    uvloop = None
+
 logger = logging.getLogger("uvicorn.error")
 
+# Number of MCP server processes kept running for /command
+MCP_WORKERS = int(os.environ.get("MCP_WORKERS", "4"))
+
+# Server tool that binds the following action calls to a game turn. Called by
+# the client directly and never offered to the agent.
+BEGIN_TURN_TOOL = "begin_turn"
+
+# Word sets generated per LLM call, and the pool size that triggers a refill
+WORD_SETS_PER_CALL = 4
+WORD_POOL_LOW_WATER = 2
+
+# Word lists need no tools or reasoning, so a smaller model does. A batch is
+# WORD_SETS_PER_CALL short lines; the cap only stops a runaway reply.
+WORD_MODEL = "openai:gpt-4.1-nano"
+WORD_MAX_TOKENS = 256
+
+# What a call on a dead server's session raises. The owning task only notices
+# the process is gone once the session is used, so alive alone can't tell.
+SERVER_GONE_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, McpError)
+
+# Servers take no per-session arguments, so every pool member shares these
+SERVER_PARAMS = StdioServerParameters(
+    command="python",
+    args=["-u", "backend/mcp_server.py"],
+)
+
 
 class Command(BaseModel):
     action1: str
@@ -30,6 +66,76 @@ class TextOutput(BaseModel):
     title: str
 
 
+@functools.cache
+def get_voice_line_agent():
+    """Tool-less agent for plain text generation, shared by every Chat."""
+    return create_agent(model=init_chat_model(WORD_MODEL, max_tokens=WORD_MAX_TOKENS))
+
+
+def last_ai_message(res: dict) -> str | None:
+    """Return the text of the agent's final reply, or None if it gave none."""
+    # The reply is at the end of the history, so scan from there
+    for msg in reversed(res["messages"]):
+        if msg.type == "ai" and msg.content != "":
+            return msg.content
+    return None
+
+
+class ToolServer:
+    """A long-lived MCP server process and its client session.
+
+    The stdio transport must be opened and closed from the same task, so each
+    server is owned by a background task that holds the connection open until
+    close() is called.
+    """
+
+    def __init__(self) -> None:
+        self.session: ClientSession | None = None
+        # Agent bound to this session's tools, built once in start()
+        self.agent = None
+        self._closing = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self, system_prompt: str):
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        self.session = await ready
+        # The tool list is fixed for the life of the server, so list it once
+        tools = await load_mcp_tools(self.session)
+        self.agent = create_agent(
+            model="openai:gpt-4.1-mini",
+            tools=[tool for tool in tools if tool.name != BEGIN_TURN_TOOL],
+            system_prompt=system_prompt,
+        )
+        return self
+
+    async def _run(self, ready: asyncio.Future):
+        try:
+            async with stdio_client(SERVER_PARAMS) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.exception("MCP server stopped unexpectedly")
+
+    @property
+    def alive(self) -> bool:
+        return (
+            self._task is not None
+            and not self._task.done()
+            and not self._closing.is_set()
+        )
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            await self._task
+
+
 class ToolChat:
     def __init__(self, chat, session_id: str, player_turn: bool) -> None:
         self.chat = chat
@@ -37,39 +143,37 @@ class ToolChat:
         self.player_turn = player_turn
 
     async def __aenter__(self):
-        self.server_params = StdioServerParameters(
-            command="python",
-            args=[
-                "-u",
-                "backend/mcp_server.py",
-                self.session_id,
-                str(self.player_turn),
-            ],
-        )
+        self.server = await self.chat.acquire_server()
+        try:
+            await self._begin_turn()
+        except SERVER_GONE_ERRORS:
+            # The process died while idle; swap it out and retry once
+            self.server = await self.chat.replace_server(self.server)
+            try:
+                await self._begin_turn()
+            except BaseException:
+                self.chat.servers.put_nowait(self.server)
+                raise
+        except BaseException:
+            self.chat.servers.put_nowait(self.server)
+            raise
+        return self.server.agent
 
-        self.client = stdio_client(self.server_params)
-        (self.read, self.write) = await self.client.__aenter__()
-        self.session = ClientSession(self.read, self.write)
-        self.session = await self.session.__aenter__()
-        await self.session.initialize()
-        tools = await load_mcp_tools(self.session)
-        agent = create_agent(
-            model="openai:gpt-4.1-mini",
-            tools=tools,
-            system_prompt=self.chat.system_prompt,
+    async def _begin_turn(self):
+        await self.server.session.call_tool(
+            BEGIN_TURN_TOOL,
+            {"session": self.session_id, "player": self.player_turn},
         )
-        return agent
 
     async def __aexit__(self, exc_type, exc, tb):
-        await self.session.__aexit__(exc_type, exc, tb)
-        await self.client.__aexit__(exc_type, exc, tb)
+        self.chat.servers.put_nowait(self.server)
 
 
 # Class to handle mcp and agent interaction
 class Chat:
-    def __init__(self):
-        self.messages = []
-        self.system_prompt: str = """You are an Ork AI agent called 'Da Warboss Protocol'.
+    # Built once per process. cleandoc drops the source indentation, which
+    # would otherwise be sent to the model with every request.
+    system_prompt: str = inspect.cleandoc("""You are an Ork AI agent called 'Da Warboss Protocol'.
         Every turn, you receive:
         Messages — That are:
             1. Ork words to interpret
@@ -77,62 +181,152 @@ class Chat:
             3. The opponent
 
         You must translate the Commander's crude Ork words in messages and perform a single action from your MCP tool list.
+        The tool result is final: once it reports ok, do not call another tool this turn.
         Then respond only in Ork speech (loud, crude, or silly). Use a maximum of 20 words. Do not include translations, descriptions or numbering
+        """)
+
+    word_generator_prompt: str = inspect.cleandoc("""Generate {n} independent groups of exactly 8 unique, funny, orkish-sounding words that orks in Warhammer 40k might use as
+        commands for offensive or defensive maneuvers in battle. Each word should feel natural in Ork speech (loud, crude, or silly). Do not include any explanations,
+        descriptions, numbering, or punctuation—output only {n} lines, one group per line, with the 8 words separated by spaces.""")
+
+    def __init__(self):
+        self.messages = []
+        self.voice_line_agent = get_voice_line_agent()
+        # Idle servers; _running also tracks the ones checked out right now
+        self.servers: asyncio.Queue[ToolServer] = asyncio.Queue()
+        self._running: list[ToolServer] = []
+
+        # Pregenerated word sets served by get_new_words
+        self.word_sets: asyncio.Queue[str] = asyncio.Queue()
+        self._word_refill: asyncio.Task | None = None
+
+    async def _spawn_server(self) -> ToolServer:
+        server = await ToolServer().start(self.system_prompt)
+        self._running.append(server)
+        return server
+
+    async def start(self, workers: int = MCP_WORKERS):
+        """Spawn the MCP server pool used by process_query and build its agents.
+
+        Also starts filling the word pool, which opens the OpenAI connection
+        the agents share before the first command arrives.
         """
+        servers = await asyncio.gather(*(self._spawn_server() for _ in range(workers)))
+        for server in servers:
+            self.servers.put_nowait(server)
+        self.refill_words()
 
-        self.word_generator_prompt: str = """Generate exactly 8 unique, funny, orkish-sounding words that orks in Warhammer 40k might use as 
-        commands for offensive or defensive maneuvers in battle. Each word should feel natural in Ork speech (loud, crude, or silly). Do not include any explanations, 
-        descriptions, numbering, or punctuation—output only the 8 words separated by spaces."""
+    async def acquire_server(self) -> ToolServer:
+        """Check a server out of the pool, replacing it if its process died."""
+        server = await self.servers.get()
+        if server.alive:
+            return server
+        return await self.replace_server(server)
 
-        self.voice_line_agent = create_agent(model="openai:gpt-4.1-mini")
+    async def replace_server(self, server: ToolServer) -> ToolServer:
+        """Shut down a dead, checked-out server and start one in its place."""
+        logger.warning("MCP server exited, starting a replacement")
+        # Ends the owning task, so the server no longer counts as alive
+        await server.close()
+        try:
+            replacement = await self._spawn_server()
+        except BaseException:
+            # Keep the pool size so the next command retries the respawn
+            self.servers.put_nowait(server)
+            raise
+        self._running.remove(server)
+        return replacement
+
+    async def close(self):
+        """Shut down every MCP server, including ones still checked out."""
+        if self._word_refill is not None:
+            self._word_refill.cancel()
+        servers, self._running = self._running, []
+        await asyncio.gather(*(server.close() for server in servers))
 
     async def process_query(self, session_id: str, player_turn: bool, query: str):
         async with ToolChat(self, session_id, player_turn) as agent:
             res = await agent.ainvoke({"messages": query})
             logger.info("done")
-            for key in res.keys():
-                for msg in res[key]:
-                    if msg.type == "ai" and msg.content != "":
-                        print("AI response\n", msg.content)
-                        return msg.content
-        return None
+        return last_ai_message(res)
 
-    async def get_new_words(self):
+    async def get_new_words_batch(self, n: int) -> list[str]:
         """
-        Generate new Ork battle words using the AI model.
+        Generate several sets of Ork battle words in a single AI call.
+
+        Args:
+            n (int): Number of word sets to request
 
         Returns:
-            str: Space-separated string of exactly 8 Orkish battle words plus "NO" (9 total), or None if generation fails
+            list[str]: Up to n space-separated strings of 8 Orkish battle words plus "NO"
         """
+        res = await self.voice_line_agent.ainvoke(
+            {"messages": self.word_generator_prompt.format(n=n)}
+        )
+        content = last_ai_message(res)
+        if content is None:
+            return []
+        word_sets = []
+        # One group of words per line, limited to exactly 8 words
+        for line in content.strip().splitlines():
+            words = line.split()[:8]
+            if words:
+                # Always add "NO" as a fallback option (9 total)
+                words.append("NO")
+                word_sets.append(" ".join(words))
+        return word_sets[:n]
+
+    async def _generate_word_sets(self) -> int:
+        """Add one batch of word sets to the pool and return how many."""
         try:
-            res = await self.voice_line_agent.ainvoke(
-                {"messages": self.word_generator_prompt}
-            )
-            for key in res.keys():
-                for msg in res[key]:
-                    if msg.type == "ai" and msg.content != "":
-                        # Clean up the content and split into words
-                        words = msg.content.strip().split()
-                        # Filter out empty strings and limit to exactly 8 words
-                        words = [w for w in words if w and len(w) > 0][:8]
-                        # Always add "NO" as a fallback option (9 total)
-                        words.append("NO")
-                        # Return as space-separated string
-                        return " ".join(words)
-            logger.warning("No AI response received for word generation")
-            return None
+            word_sets = await self.get_new_words_batch(WORD_SETS_PER_CALL)
         except Exception as e:
-            logger.error(f"Error generating new words: {str(e)}")
-            return None
+            logger.error("Error generating new words: %s", e)
+            return 0
+        for words in word_sets:
+            self.word_sets.put_nowait(words)
+        return len(word_sets)
+
+    def refill_words(self) -> asyncio.Task:
+        """Start generating more word sets unless a refill is already running."""
+        if self._word_refill is None or self._word_refill.done():
+            self._word_refill = asyncio.create_task(self._generate_word_sets())
+        return self._word_refill
+
+    async def get_new_words(self):
+        """
+        Take a set of new Ork battle words from the pregenerated pool.
+
+        Waits for a refill when the pool is empty, and starts one in the
+        background when it runs low. Returns None only when a refill
+        produced no words at all.
+
+        Returns:
+            str: Space-separated string of exactly 8 Orkish battle words plus "NO" (9 total), or None if generation fails
+        """
+        # Other waiters may take a whole batch before this one gets a set, so
+        # keep refilling until one is left or generation itself fails
+        while self.word_sets.empty():
+            # Shielded so a cancelled caller does not cancel the refill the
+            # other waiters share
+            if not await asyncio.shield(self.refill_words()):
+                logger.warning("No AI response received for word generation")
+                return None
+        words = self.word_sets.get_nowait()
+        if self.word_sets.qsize() < WORD_POOL_LOW_WATER:
+            self.refill_words()
+        return words
 
 
 async def test():
     chat = Chat()
+    await chat.start(workers=1)
     start = time.time()
     resp = await chat.process_query("session-1", True, "")
     end = time.time()
     print("words:", resp, "took", end - start)
+    await chat.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(test())
+    asyncio.run(test(), loop_factory=uvloop.new_event_loop if uvloop else None)
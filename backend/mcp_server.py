@@ -1,82 +1,107 @@
+import asyncio
 import logging
-import sys
 from mcp.server.fastmcp import FastMCP
 
+try:
+    import uvloop
+except ImportError:  # Not built for Windows
+    uvloop = None
+
 from ipc import send_ipc_message
 from action import ActionEnum
 
-session_id = sys.argv[1]
-player_turn = sys.argv[2] == "True"
+# The client binds each turn through begin_turn before the agent runs, so one
+# long-lived server process can serve any session.
+session_id: str | None = None
+player_turn = True
 
-# Create an MCP server
+# Create an MCP server. Action tools push the blocking socket write to a
+# thread (see perform), so several tool calls from one model step can run
+# side by side.
 mcp = FastMCP("orkgame")
 
 
+async def perform(action: ActionEnum) -> dict:
+    """Apply action to the bound turn and report it back to the agent"""
+    await asyncio.to_thread(send_ipc_message, session_id, action, player_turn)
+    # Spelling the outcome out keeps the model from calling the tool again
+    # to check whether anything happened
+    return {"ok": True, "action": action.value}
+
+
+@mcp.tool()
+def begin_turn(session: str, player: bool):
+    """Internal: binds the following actions to a game session and side"""
+    global session_id, player_turn
+    session_id = session
+    player_turn = player
+    return
+
+
 @mcp.tool()
-def shoot_rocket():
+async def shoot_rocket() -> dict:
     """Shoots your armor shredding rocket"""
     logging.info("FIRING ROCKET")
-    send_ipc_message(session_id, ActionEnum.shoot_rocket, player_turn)
-    return
+    return await perform(ActionEnum.shoot_rocket)
 
 
 @mcp.tool()
-def rage_up():
+async def rage_up() -> dict:
     """Shouts a powerful battlecry that gives you a damage amplifier and might fear enemies"""
     logging.info("Shouting Waag (rage_up)")
-    send_ipc_message(session_id, ActionEnum.rage_up, player_turn)
-    return
+    return await perform(ActionEnum.rage_up)
 
 
 @mcp.tool()
-def patch_up():
+async def patch_up() -> dict:
     """Heals your battlewounds"""
     logging.info("Healing now (patch_up)")
-    send_ipc_message(session_id, ActionEnum.patch_up, player_turn)
-    return
+    return await perform(ActionEnum.patch_up)
 
 
 @mcp.tool()
-def charge():
+async def charge() -> dict:
     """Charges in to hit the enemy with your axe"""
     logging.info("Hitting enemy with axe now (charge)")
-    send_ipc_message(session_id, ActionEnum.charge, player_turn)
-    return
+    return await perform(ActionEnum.charge)
 
 
 @mcp.tool()
-def throw_granade():
+async def throw_granade() -> dict:
     """Throws your highly explosive granade"""
     logging.info("Throwing granade")
-    send_ipc_message(session_id, ActionEnum.throw_granade, player_turn)
-    return
+    return await perform(ActionEnum.throw_granade)
 
 
 @mcp.tool()
-def fire_flamethrower():
+async def fire_flamethrower() -> dict:
     """Burn enemies with your flamethrower"""
     logging.info("Flamethrowing now")
-    send_ipc_message(session_id, ActionEnum.fire_flamethrower, player_turn)
-    return
+    return await perform(ActionEnum.fire_flamethrower)
 
 
 @mcp.tool()
-def armor_up():
+async def armor_up() -> dict:
     """Reinforce your armor and prepare for booms"""
     logging.info("Armor up")
-    send_ipc_message(session_id, ActionEnum.armor_up, player_turn)
+    return await perform(ActionEnum.armor_up)
 
 
 @mcp.tool()
-def omniboost():
+async def omniboost() -> dict:
     """Your roar bellows over the battlefield, perform when all commands point to Waarghing"""
     logging.info("Omniboosting")
-    send_ipc_message(session_id, ActionEnum.omniboost, player_turn)
+    return await perform(ActionEnum.omniboost)
 
 
 if __name__ == "__main__":
-    with open("/tmp/log", "w+") as f:
-        print("Starting MCP server...", file=sys.stderr, flush=True)
-        # Initialize and run the server
-        mcp.run(transport="stdio")
-        print("Stopping MCP server...", file=sys.stderr, flush=True)
+    # stdout carries the JSON-RPC stream, so everything else goes to stderr.
+    # FastMCP sets the root logger up that way; the tools log through it.
+    logging.info("Starting MCP server...")
+    # Initialize and run the server, on uvloop where available to cut
+    # the per-message cost of the stdio pipe
+    asyncio.run(
+        mcp.run_stdio_async(),
+        loop_factory=uvloop.new_event_loop if uvloop else None,
+    )
+    logging.info("Stopping MCP server...")
@@ -1,22 +1,37 @@
+import asyncio
 import enum
+import hashlib
 import logging
 import os
-from fastapi import Cookie, HTTPException, Request, status
+from fastapi import Cookie, Depends, HTTPException, Request, status
 from pydantic import BaseModel, Field
 from pydantic.type_adapter import TypeAdapter
 import math
 
 
 try:
-    from .action import ActionEnum, Effect
+    from .action import ACTIONS_BY_VALUE, ActionEnum, Effect
     from .enemy import Enemy
 except ImportError:
-    from action import ActionEnum, Effect
+    from action import ACTIONS_BY_VALUE, ActionEnum, Effect
     from enemy import Enemy
 
 logger = logging.getLogger("uvicorn.error")
 
 STATE_FOLDER = os.environ.get("STATE_FOLDER", "./")
+SESSIONS_FOLDER = os.path.join(STATE_FOLDER, "sessions")
+# Single-file state from before sessions got their own files
+LEGACY_STATE_FILE = os.path.join(STATE_FOLDER, "state.json")
+
+# Seconds to collect further changes before dirty sessions are written
+STATE_WRITE_DELAY = 0.5
+
+# A session that keeps failing to write is retried after STATE_WRITE_DELAY,
+# doubling per failure up to this many seconds
+STATE_RETRY_MAX_DELAY = 60.0
+
+# fdatasync skips the metadata flush, but macOS and Windows only have fsync
+_fdatasync = getattr(os, "fdatasync", os.fsync)
 
 
 class Actor(enum.StrEnum):
@@ -72,47 +87,32 @@ class GameSession(BaseModel):
         self.currenthealth = maxhp
 
     def act(self, action: str, player_turn: bool):
-        action = ActionEnum(action)
+        action = ACTIONS_BY_VALUE[action]
         effect = action.effect()
         logger.info("Got effect: %s", effect)
         if player_turn:
             # Force to not be below 1
-            if (self.armor + effect.gain_armor - effect.loose_armor) >= 1:
-                self.armor = self.armor + effect.gain_armor - effect.loose_armor
-            else:
-                self.armor = 1
+            self.armor = max(1, self.armor + effect.gain_armor - effect.loose_armor)
             # Do not go below 1
-            if (self.rage + effect.gain_damage_boost - effect.loose_damage_boost) >= 1:
-                self.rage = (
-                    self.rage + effect.gain_damage_boost - effect.loose_damage_boost
-                )
-            else:
-                self.rage = 1
-
-            if (self.currenthealth + effect.self_heal) > (
-                effect.self_damage * (1 / self.armor) * self.enemyrage
-            ):
-                self.currenthealth = math.ceil(
-                    self.currenthealth
-                    + effect.self_heal
-                    - (effect.self_damage * (1 / self.armor) * self.enemyrage)
-                )
-                if self.currenthealth > self.maxhealth:
-                    self.currenthealth = self.maxhealth
+            self.rage = max(
+                1, self.rage + effect.gain_damage_boost - effect.loose_damage_boost
+            )
+
+            # Each side's damage is scaled by the attacker's rage and the
+            # defender's (already updated) armor
+            self_damage = effect.self_damage * (1 / self.armor) * self.enemyrage
+            enemy_damage = effect.enemy_damage * (1 / self.enemyarmor) * self.rage
+
+            health = self.currenthealth + effect.self_heal - self_damage
+            if health > 0:
+                self.currenthealth = min(self.maxhealth, math.ceil(health))
             else:
                 self.currenthealth = 0
                 self.gameover = True
 
-            if (self.enemycurrenthealth + effect.enemy_heal) > (
-                (effect.enemy_damage * (1 / self.enemyarmor)) * self.rage
-            ):
-                self.enemycurrenthealth = math.ceil(
-                    self.enemycurrenthealth
-                    + effect.enemy_heal
-                    - (effect.enemy_damage * (1 / self.enemyarmor)) * self.rage
-                )
-                if self.enemycurrenthealth > self.enemymaxhealth:
-                    self.enemycurrenthealth = self.enemymaxhealth
+            health = self.enemycurrenthealth + effect.enemy_heal - enemy_damage
+            if health > 0:
+                self.enemycurrenthealth = min(self.enemymaxhealth, math.ceil(health))
             else:
                 self.kills += 1
                 self.enemycurrenthealth = 100 + (50 * self.kills)
@@ -124,52 +124,31 @@ class GameSession(BaseModel):
 
         else:
             # Force to not be below 1
-            if (self.enemyarmor + effect.gain_armor - effect.loose_armor) >= 1:
-                self.enemyarmor = (
-                    self.enemyarmor + effect.gain_armor - effect.loose_armor
-                )
-            else:
-                self.enemyarmor = 1
+            self.enemyarmor = max(
+                1, self.enemyarmor + effect.gain_armor - effect.loose_armor
+            )
             # Do not go below 1
-            if (
-                self.enemyrage + effect.gain_damage_boost - effect.loose_damage_boost
-            ) >= 1:
-                self.enemyrage = (
-                    self.enemyrage
-                    + effect.gain_damage_boost
-                    - effect.loose_damage_boost
-                )
-            else:
-                self.enemyrage = 1
-
-            if (self.enemycurrenthealth + effect.self_heal) > (
-                effect.self_damage * (1 / self.enemyarmor) * self.rage
-            ):
-                self.enemycurrenthealth = math.ceil(
-                    self.enemycurrenthealth
-                    + effect.self_heal
-                    - (effect.self_damage * (1 / self.enemyarmor) * self.rage)
-                )
-                if self.enemycurrenthealth > self.enemymaxhealth:
-                    self.enemycurrenthealth = self.enemymaxhealth
+            self.enemyrage = max(
+                1, self.enemyrage + effect.gain_damage_boost - effect.loose_damage_boost
+            )
+
+            self_damage = effect.self_damage * (1 / self.enemyarmor) * self.rage
+            health = self.enemycurrenthealth + effect.self_heal - self_damage
+            if health > 0:
+                self.enemycurrenthealth = min(self.enemymaxhealth, math.ceil(health))
             else:
                 self.kills += 1
                 self.enemycurrenthealth = 100 + (50 * self.kills)
-                self.enemymax = 100 + (50 * self.kills)
+                self.enemymaxhealth = 100 + (50 * self.kills)
                 self.enemyrage = 1 + self.kills // 2
                 self.enemyarmor = 1 + self.kills // 2
                 self.maxhealth += 20
 
-            if (self.currenthealth + effect.enemy_heal) > (
-                (effect.enemy_damage * (1 / self.armor)) * self.enemyrage
-            ):
-                self.currenthealth = math.ceil(
-                    self.currenthealth
-                    + effect.enemy_heal
-                    - (effect.enemy_damage * (1 / self.armor)) * self.enemyrage
-                )
-                if self.currenthealth > self.maxhealth:
-                    self.currenthealth = self.maxhealth
+            # After the block above, which may have replaced the enemy
+            enemy_damage = effect.enemy_damage * (1 / self.armor) * self.enemyrage
+            health = self.currenthealth + effect.enemy_heal - enemy_damage
+            if health > 0:
+                self.currenthealth = min(self.maxhealth, math.ceil(health))
             else:
                 self.currenthealth = 0
                 self.gameover = True
@@ -178,6 +157,8 @@ class GameSession(BaseModel):
 
 
 SessionStorage = TypeAdapter(dict[str, GameSession])
+# Single session files; dump_json gives bytes without a str round trip
+SessionFile = TypeAdapter(GameSession)
 
 
 def get_game_session(
@@ -196,10 +177,8 @@ def get_game_session(
 
 
 def get_session_state(
-    request: Request,
-    game_session: str | None = Cookie(default=None, alias="game-session"),
+    request: Request, session: str = Depends(get_game_session)
 ) -> GameSession:
-    session = get_game_session(game_session)
     state = request.app.state.state.get(session)
     if state is None:
         return GameSession.new_session(session)
@@ -208,23 +187,166 @@ def get_session_state(
 
 def save_session_state(request: Request, session: GameSession):
     request.app.state.state[session.name] = session
+    mark_session_dirty(request.app, session.name)
+
+
+def mark_session_dirty(app, name: str):
+    """Queue a session for the background writer."""
+    app.state.dirty_sessions.add(name)
+    app.state.state_dirty.set()
+
+
+async def state_writer(app):
+    """Write dirty sessions in the background until stop_state_writer is called.
+
+    Changes made within STATE_WRITE_DELAY of each other share one write, and
+    only the sessions that changed are written.
+    """
+    dirty = app.state.state_dirty
+    # Consecutive failed writes per session, for backoff and quieter logs
+    failures: dict[str, int] = {}
+    loop = asyncio.get_running_loop()
+    while True:
+        await dirty.wait()
+        if not app.state.state_writer_stopping:
+            await asyncio.sleep(STATE_WRITE_DELAY)
+        stopping = app.state.state_writer_stopping
+        dirty.clear()
+        # Serialize here on the event loop so the snapshot is consistent,
+        # and leave only the file I/O to the thread
+        files = _take_dirty_sessions(app)
+        failed = await asyncio.to_thread(_write_session_files, files)
+        for name in files.keys() - failed.keys():
+            failures.pop(name, None)
+        for name, error in failed.items():
+            failures[name] = failures.get(name, 0) + 1
+            _log_write_failure(name, error, failures[name])
+        if stopping:
+            # Final flush, nothing is left to retry it
+            return
+        # Retry only what did not make it to disk, backing off so a full or
+        # read-only disk is not hit (and logged) twice a second
+        for name in failed:
+            delay = min(
+                STATE_WRITE_DELAY * 2 ** failures[name], STATE_RETRY_MAX_DELAY
+            )
+            loop.call_later(delay, mark_session_dirty, app, name)
+
+
+async def stop_state_writer(app, writer: asyncio.Task):
+    """Have the writer flush everything still dirty, then wait for it to exit.
+
+    Cancelling it instead could leave its thread writing while another
+    write of the same files starts.
+    """
+    app.state.state_writer_stopping = True
+    app.state.state_dirty.set()
+    await writer
+
 
+def _take_dirty_sessions(app) -> dict[str, bytes]:
+    state = app.state.state
+    names = app.state.dirty_sessions
+    files = {
+        name: SessionFile.dump_json(state[name]) for name in names if name in state
+    }
+    names.clear()
+    return files
 
-async def storage_middleware(request: Request, call_next):
-    response = await call_next(request)
-    write_state(request.app.state.state)
-    return response
+
+def _session_path(name: str) -> str:
+    # Session names come from the client cookie, so the file is named after
+    # a digest: fixed length and no path separators whatever the name holds.
+    # The name itself is stored in the file and used as the key on load.
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    return os.path.join(SESSIONS_FOLDER, f"{digest}.json")
 
 
 def read_state():
-    try:
-        with open(f"{STATE_FOLDER}/state.json", "r") as f:
-            data = f.read()
-        return SessionStorage.validate_json(data)
-    except Exception:
-        return {}
+    """Load every stored session, keyed by name.
+
+    A state.json from before sessions were stored one per file is split
+    into the sessions folder on first start.
+    """
+    if not os.path.isdir(SESSIONS_FOLDER):
+        try:
+            with open(LEGACY_STATE_FILE, "rb") as f:
+                data = f.read()
+            state = SessionStorage.validate_json(data)
+        except Exception:
+            state = {}
+        write_state(state)
+        return state
+
+    state = {}
+    with os.scandir(SESSIONS_FOLDER) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                # Bytes go straight to the Rust parser, no str decode first
+                with open(entry.path, "rb") as f:
+                    session = SessionFile.validate_json(f.read())
+            except Exception:
+                logger.warning("Skipping unreadable session file %s", entry.name)
+                continue
+            state[session.name] = session
+    return state
 
 
-def write_state(state: dict[str, GameSession]):
-    with open(f"{STATE_FOLDER}/state.json", "wb+") as f:
-        f.write(SessionStorage.dump_json(state))
+def write_state(state: dict[str, GameSession]) -> list[str]:
+    """Write every session in state, returning the names that failed."""
+    failed = _write_session_files(
+        {name: SessionFile.dump_json(session) for name, session in state.items()}
+    )
+    for name, error in failed.items():
+        _log_write_failure(name, error, 1)
+    return list(failed)
+
+
+def _log_write_failure(name: str, error: OSError, attempt: int):
+    # The traceback says nothing new after the first failure in a row
+    if attempt == 1:
+        logger.error("Failed to write session %r", name, exc_info=error)
+    else:
+        logger.warning(
+            "Still failing to write session %r (attempt %d): %s", name, attempt, error
+        )
+
+
+def _write_session_files(files: dict[str, bytes]) -> dict[str, OSError]:
+    """Write each session file, returning the error for every one that failed."""
+    try:
+        os.makedirs(SESSIONS_FOLDER, exist_ok=True)
+    except OSError as e:
+        return dict.fromkeys(files, e)
+    if not files:
+        return {}
+    failed = {}
+    for name, data in files.items():
+        # Write next to the target and swap it in, so a crash mid-write
+        # never leaves a truncated session file behind
+        path = _session_path(name)
+        try:
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+                f.flush()
+                # The data must be on disk before the rename can expose it
+                _fdatasync(f.fileno())
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            # One bad file must not keep the rest of the batch off disk
+            failed[name] = e
+    # Persist the renames too, once for the whole batch. Directories cannot
+    # be opened for this outside POSIX.
+    if os.name == "posix":
+        try:
+            fd = os.open(SESSIONS_FOLDER, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            # The renames may not survive a crash, so retry the whole batch
+            return dict.fromkeys(files, e)
+    return failed